@@ -1,43 +1,117 @@
 # api.py
-from fastapi import FastAPI
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import FastAPI, Request
 from pydantic import BaseModel
-from vector_db import VectorDB
+from vector_db import EmbeddingBatcher, VectorDB
+
+# Threads for blocking VectorDB work (Chroma I/O and embedding). Encoding is CPU-bound,
+# so there is little to gain from more threads than cores.
+EXECUTOR_WORKERS = int(os.environ.get("VECTOR_DB_EXECUTOR_WORKERS", os.cpu_count() or 1))
+
+def create_db():
+    """
+    Initialize the VectorDB class. Set CHROMA_HOST to use a Chroma server, which is required
+    when running several workers (see gunicorn.conf.py).
+    """
+    intra_op_threads = os.environ.get("VECTOR_DB_INTRA_OP_THREADS")
+    chroma_host = os.environ.get("CHROMA_HOST")
+    # No default: Chroma's default port (8000) is also the API's, so guessing could point the client at itself
+    if chroma_host and not os.environ.get("CHROMA_PORT"):
+        raise RuntimeError("CHROMA_PORT must be set when CHROMA_HOST is set.")
+    return VectorDB(
+        chroma_host=chroma_host,
+        chroma_port=int(os.environ["CHROMA_PORT"]) if chroma_host else None,
+        intra_op_threads=int(intra_op_threads) if intra_op_threads else None
+    )
 
-app = FastAPI()
-# Initialize the VectorDB class
-db = VectorDB()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One VectorDB per worker process, kept for its lifetime so collection handles,
+    # caches and the loaded model are shared by every request
+    app.state.executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS)
+    app.state.db = create_db()
+    # Load the model at startup rather than on the first request
+    await asyncio.get_running_loop().run_in_executor(app.state.executor, lambda: app.state.db.model)
+    # Coalesces embedding work from concurrent requests into batched model calls
+    app.state.batcher = EmbeddingBatcher(app.state.db)
+    app.state.batcher.start(app.state.executor)
+    yield
+    await app.state.batcher.stop()
+    app.state.executor.shutdown(wait=True)
+
+app = FastAPI(lifespan=lifespan)
+
+async def run_blocking(request: Request, func, *args, **kwargs):
+    """
+    Run a blocking VectorDB call in the app's executor so the event loop stays free.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app.state.executor, functools.partial(func, *args, **kwargs))
 
 class DocumentRequest(BaseModel):
     collection_name: str
     doc_id: str
     text: str
 
+class DocumentItem(BaseModel):
+    doc_id: str
+    text: str
+
+class DocumentsRequest(BaseModel):
+    collection_name: str
+    items: List[DocumentItem]
+
 class QueryRequest(BaseModel):
     collection_name: str
     query_text: str
     top_n: int = 3
 
 @app.post("/create_collection")
-def create_collection(collection_name: str):
-    db.create_collection(collection_name)
+async def create_collection(collection_name: str, request: Request):
+    db = request.app.state.db
+    await run_blocking(request, db.create_collection, collection_name)
     return {"message": f"Collection '{collection_name}' created."}
 
 @app.post("/insert_document")
-def insert_document(data: DocumentRequest):
-    db.insert_document(data.collection_name, data.doc_id, data.text)
+async def insert_document(data: DocumentRequest, request: Request):
+    db = request.app.state.db
+    embedding = await request.app.state.batcher.embed(data.text)
+    await run_blocking(request, db.insert_document, data.collection_name, data.doc_id, data.text, embedding=embedding)
     return {"message": f"Document '{data.doc_id}' inserted."}
 
+@app.post("/insert_documents")
+async def insert_documents(data: DocumentsRequest, request: Request):
+    db = request.app.state.db
+    # Already a batch, so it is embedded directly rather than through the micro-batcher
+    await run_blocking(request, db.insert_documents, data.collection_name,
+                       [item.doc_id for item in data.items], [item.text for item in data.items])
+    return {"message": f"{len(data.items)} documents inserted."}
+
 @app.post("/update_document")
-def update_document(data: DocumentRequest):
-    db.update_document(data.collection_name, data.doc_id, data.text)
+async def update_document(data: DocumentRequest, request: Request):
+    db = request.app.state.db
+    embedding = await request.app.state.batcher.embed(data.text)
+    await run_blocking(request, db.update_document, data.collection_name, data.doc_id, data.text, embedding=embedding)
     return {"message": f"Document '{data.doc_id}' updated."}
 
 @app.delete("/delete_document")
-def delete_document(collection_name: str, doc_id: str):
-    db.delete_document(collection_name, doc_id)
+async def delete_document(collection_name: str, doc_id: str, request: Request):
+    db = request.app.state.db
+    await run_blocking(request, db.delete_document, collection_name, doc_id)
     return {"message": f"Document '{doc_id}' deleted from '{collection_name}'."}
 
 @app.post("/retrieve")
-def retrieve_documents(data: QueryRequest):
-    results = db.retrieve_similar_documents(data.collection_name, data.query_text, data.top_n)
+async def retrieve_documents(data: QueryRequest, request: Request):
+    db = request.app.state.db
+    results = db.cached_similar_documents(data.collection_name, data.query_text, data.top_n)
+    if results is None:
+        query_embedding = await request.app.state.batcher.embed(data.query_text)
+        results = await run_blocking(request, db.retrieve_similar_documents, data.collection_name,
+                                     data.query_text, data.top_n, query_embedding=query_embedding)
     return {"results": results}
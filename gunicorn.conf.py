@@ -0,0 +1,20 @@
+# gunicorn.conf.py
+# Production launch: CHROMA_HOST=... CHROMA_PORT=... gunicorn -c gunicorn.conf.py api:app
+import os
+
+# Each worker is a separate process with its own model and caches, so embedding work
+# runs in parallel instead of contending for one interpreter's GIL.
+# os.cpu_count() counts hyperthreads; halving it approximates physical cores.
+if os.environ.get("CHROMA_HOST"):
+    workers = int(os.environ.get("WEB_CONCURRENCY", max(1, (os.cpu_count() or 1) // 2)))
+else:
+    # Without a Chroma server every worker would open its own PersistentClient (and in-memory
+    # HNSW index) on the same directory, so local storage is limited to a single worker
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers != 1:
+        raise RuntimeError("WEB_CONCURRENCY > 1 requires CHROMA_HOST/CHROMA_PORT to point at a shared Chroma server.")
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+# Split the cores between workers so their ONNX Runtime thread pools don't oversubscribe the CPU
+os.environ.setdefault("VECTOR_DB_INTRA_OP_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
@@ -1,9 +1,12 @@
 # test_vector_db.py
+import asyncio
 import pytest
 import os
+import threading
+import numpy as np
 #os.environ["CHROMA_INDEX_IMPL"] = "flat"  # must be done before creating Chroma client
 
-from vector_db import VectorDB
+from vector_db import EmbeddingBatcher, QueryCache, SemanticCache, VectorDB
 
 @pytest.fixture(scope="function")
 def db():
@@ -32,8 +35,230 @@ def test_update_document(db):
     assert doc_id == "doc1"
     assert "updated" in text_content
 
+def test_update_missing_document_inserts_it(db):
+    db.delete_collection("update_collection")
+    db.create_collection("update_collection")
+    db.update_document("update_collection", "doc1", "Brand new text")
+    results = db.retrieve_similar_documents("update_collection", "new text", top_n=1)
+    assert len(results) == 1
+    assert results[0][0] == "doc1"
+
 def test_delete_document(db):
     db.delete_document("test_collection", "doc1")
     results = db.retrieve_similar_documents("test_collection", "test text", top_n=1)
     # Should not return any doc
     assert len(results) == 0
+
+def test_query_cache_lru_and_invalidate():
+    cache = QueryCache(max_size=2, ttl_seconds=600)
+    cache.put(("a", "q1", 1), "r1")
+    cache.put(("b", "q2", 1), "r2")
+    cache.get(("a", "q1", 1))  # mark as most recently used
+    cache.put(("a", "q3", 1), "r3")
+    assert cache.get(("b", "q2", 1)) is None  # least recently used got evicted
+    assert cache.get(("a", "q1", 1)) == "r1"
+    cache.invalidate("a")
+    assert cache.get(("a", "q1", 1)) is None
+    assert cache.get(("a", "q3", 1)) is None
+
+def test_query_cache_drops_put_from_before_invalidate():
+    cache = QueryCache()
+    generation = cache.generation("a")
+    cache.invalidate("a")  # a write lands while the stale result is being computed
+    cache.put(("a", "q1", 1), "stale", generation=generation)
+    assert cache.get(("a", "q1", 1)) is None
+    cache.put(("a", "q1", 1), "fresh", generation=cache.generation("a"))
+    assert cache.get(("a", "q1", 1)) == "fresh"
+
+def test_query_cache_ttl():
+    cache = QueryCache(ttl_seconds=0)
+    cache.put(("a", "q1", 1), "r1")
+    assert cache.get(("a", "q1", 1)) is None
+
+def test_retrieve_cache_invalidated_on_insert(db):
+    db.delete_collection("cache_collection")
+    db.create_collection("cache_collection")
+    db.insert_document("cache_collection", "doc1", "The cat sat on the mat")
+    assert len(db.retrieve_similar_documents("cache_collection", "cat", top_n=2)) == 1
+    assert db.cached_similar_documents("cache_collection", "cat", top_n=2) is not None
+    db.insert_document("cache_collection", "doc2", "A cat chased the mouse")
+    assert db.cached_similar_documents("cache_collection", "cat", top_n=2) is None
+    assert len(db.retrieve_similar_documents("cache_collection", "cat", top_n=2)) == 2
+
+def test_semantic_cache_similarity_threshold():
+    cache = SemanticCache(max_size=2, threshold=0.97)
+    results = [("doc1", "text1", 0.9), ("doc2", "text2", 0.8)]
+    cache.put("a", [1.0, 0.0, 0.0], 2, results)
+    assert cache.get("a", [0.99, 0.05, 0.0], 1) == results[:1]  # near-duplicate query hits
+    assert cache.get("a", [0.0, 1.0, 0.0], 1) is None  # dissimilar query misses
+    assert cache.get("b", [1.0, 0.0, 0.0], 1) is None  # other collection misses
+    assert cache.get("a", [1.0, 0.0, 0.0], 3) is None  # not enough cached results
+    cache.invalidate("a")
+    assert cache.get("a", [1.0, 0.0, 0.0], 1) is None
+
+def test_semantic_caches_queried_concurrently():
+    # Separate caches have separate locks, so their scans really do run at the same time
+    caches = [SemanticCache(max_size=500) for _ in range(2)]
+    rng = np.random.default_rng(0)
+    for cache in caches:
+        for i in range(500):
+            cache.put("a", rng.standard_normal(384), 1, [(f"doc{i}", "text", 0.9)])
+    query = rng.standard_normal(384)
+    errors = []
+
+    def scan(cache):
+        try:
+            for _ in range(200):
+                cache.get("a", query, 1)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=scan, args=(cache,)) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+def test_semantic_cache_ttl():
+    cache = SemanticCache(ttl_seconds=0)
+    cache.put("a", [1.0, 0.0], 1, [("doc1", "text1", 0.9)])
+    assert cache.get("a", [1.0, 0.0], 1) is None
+
+def test_semantic_cache_disabled_with_zero_size():
+    cache = SemanticCache(max_size=0)
+    cache.put("a", [1.0, 0.0], 1, [("doc1", "text1", 0.9)])
+    assert cache.get("a", [1.0, 0.0], 1) is None
+
+def test_semantic_cache_drops_put_from_before_invalidate():
+    cache = SemanticCache(max_size=2)
+    generation = cache.generation("a")
+    cache.invalidate("a")
+    cache.put("a", [1.0, 0.0], 1, [("doc1", "text1", 0.9)], generation=generation)
+    assert cache.get("a", [1.0, 0.0], 1) is None
+
+def test_insert_documents_batch(db):
+    db.delete_collection("batch_collection")
+    db.create_collection("batch_collection")
+    db.insert_documents(
+        "batch_collection",
+        ["doc1", "doc2", "doc3"],
+        ["Cats are small furry pets", "The stock market fell sharply today", "A kitten is a young cat"]
+    )
+    results = db.retrieve_similar_documents("batch_collection", "stock market news", top_n=1)
+    assert len(results) == 1
+    doc_id, text_content, score = results[0]
+    assert doc_id == "doc2"
+    assert "stock market" in text_content
+
+def test_insert_documents_length_mismatch(db):
+    with pytest.raises(ValueError):
+        db.insert_documents("batch_collection", ["doc1", "doc2"], ["only one text"])
+
+class FakeEmbedDB:
+    """
+    Stands in for VectorDB in EmbeddingBatcher tests: records each batch and "embeds" a text as [text].
+    """
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+
+    def _embed_texts(self, texts, batch_size=32):
+        self.batches.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return [[text] for text in texts]
+
+class FakeModel:
+    """
+    Stands in for the SentenceTransformer: records the texts it is given and embeds each as a text-derived vector.
+    """
+    def __init__(self):
+        self.calls = []
+
+    @staticmethod
+    def vector(text):
+        return [float(len(text)), float(ord(text[0]))]
+
+    def encode(self, texts, **kwargs):
+        self.calls.append(list(texts))
+        return np.array([self.vector(text) for text in texts], dtype=np.float32)
+
+def test_embed_texts_restores_input_order(tmp_path):
+    db = VectorDB(persist_directory=str(tmp_path))
+    db._model = FakeModel()
+    texts = ["a much longer piece of text", "b", "c medium text", "d", "e longest text of them all, by far"]
+    embeddings = db._embed_texts(texts)
+    # Encoded in length order, returned in input order
+    assert db._model.calls == [sorted(texts, key=len)]
+    assert embeddings == [FakeModel.vector(text) for text in texts]
+
+def run_with_batcher(fake_db, scenario, **batcher_kwargs):
+    async def main():
+        batcher = EmbeddingBatcher(fake_db, **batcher_kwargs)
+        batcher.start()
+        try:
+            return await scenario(batcher)
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+def test_embedding_batcher_coalesces_in_order():
+    fake_db = FakeEmbedDB()
+    texts = [f"text {i}" for i in range(10)]
+
+    async def scenario(batcher):
+        return await asyncio.gather(*(batcher.embed(text) for text in texts))
+
+    results = run_with_batcher(fake_db, scenario, max_batch_size=4, max_wait=0.05)
+    assert results == [[text] for text in texts]
+    assert all(len(batch) <= 4 for batch in fake_db.batches)
+    assert len(fake_db.batches) == 3
+    assert sorted(text for batch in fake_db.batches for text in batch) == sorted(texts)
+
+def test_embedding_batcher_propagates_errors():
+    fake_db = FakeEmbedDB(error=RuntimeError("encode failed"))
+
+    async def scenario(batcher):
+        return await asyncio.gather(*(batcher.embed(f"text {i}") for i in range(3)), return_exceptions=True)
+
+    results = run_with_batcher(fake_db, scenario, max_batch_size=4, max_wait=0.05)
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_embedding_batcher_skips_cancelled_callers():
+    fake_db = FakeEmbedDB()
+
+    async def scenario(batcher):
+        cancelled = asyncio.create_task(batcher.embed("cancelled"))
+        kept = asyncio.create_task(batcher.embed("kept"))
+        await asyncio.sleep(0)  # let both requests reach the queue
+        cancelled.cancel()
+        return await kept
+
+    assert run_with_batcher(fake_db, scenario, max_batch_size=4, max_wait=0.05) == ["kept"]
+    assert fake_db.batches == [["kept"]]
+
+def test_load_model_falls_back_to_torch(monkeypatch):
+    backends = []
+
+    def fake_sentence_transformer(name, device=None, backend="torch", model_kwargs=None):
+        backends.append(backend)
+        if backend == "onnx":
+            raise OSError("offline")
+        return "torch model"
+
+    monkeypatch.setattr("vector_db.SentenceTransformer", fake_sentence_transformer)
+    assert VectorDB._load_model("all-MiniLM-L6-v2", "cpu", "onnx") == "torch model"
+    assert backends == ["onnx", "torch"]
+
+def test_stale_collection_handle_is_refreshed(tmp_path):
+    writer = VectorDB(persist_directory=str(tmp_path))
+    reader = VectorDB(persist_directory=str(tmp_path))
+    reader.insert_documents("stale_collection", ["doc1"], ["first"], embeddings=[[1.0, 0.0]])
+    # Another process deletes and recreates the collection, so reader's cached handle is stale
+    writer.delete_collection("stale_collection")
+    writer.create_collection("stale_collection")
+    reader.insert_documents("stale_collection", ["doc2"], ["second"], embeddings=[[1.0, 0.0]])
+    results = reader.retrieve_similar_documents("stale_collection", "query", top_n=5, query_embedding=[1.0, 0.0])
+    assert [doc_id for doc_id, _, _ in results] == ["doc2"]
@@ -1,17 +1,252 @@
 # vector_db.py
+import asyncio
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
 #os.environ["CHROMA_INDEX_IMPL"] = "flat" # must be done before chroma client is created to avoid HNSW error
 import chromadb
-from chromadb.config import Settings
+import numpy as np
+from chromadb.errors import InvalidArgumentError, InvalidCollectionException
 from sentence_transformers import SentenceTransformer
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+# Dynamically INT8-quantized ONNX export published alongside the sentence-transformers hub models
+ONNX_QUANTIZED_FILE = "onnx/model_quint8_avx2.onnx"
+
+# HNSW index parameters applied to every collection this class creates. Embeddings are
+# L2-normalized before storage, so inner product ranks exactly like cosine without the norm divisions.
+HNSW_METADATA = {"hnsw:space": "ip", "hnsw:construction_ef": 200, "hnsw:M": 16, "hnsw:search_ef": 100}
+
+DEFAULT_CACHE_CONFIG = {"max_size": 2000, "ttl_seconds": 600}
+# "ttl_seconds" defaults to the exact cache's TTL
+DEFAULT_SEMANTIC_CACHE_CONFIG = {"max_size": 2000, "threshold": 0.97}
+
+if numba is not None:
+    # Serial on purpose: a parallel kernel gains nothing at cache sizes of a few thousand rows, and
+    # numba's fallback "workqueue" threading layer aborts the process when two threads (e.g. two
+    # VectorDB instances) run a parallel kernel at the same time
+    @numba.njit(fastmath=True, cache=True)
+    def _semantic_cache_scan(cache, query, eligible, threshold):
+        """
+        Return the index of the eligible row of `cache` with the highest dot product with `query`,
+        if it is >= `threshold`, else -1.
+        """
+        n, dim = cache.shape
+        best = -1
+        best_sim = threshold
+        for i in range(n):
+            if eligible[i]:
+                s = 0.0
+                for j in range(dim):
+                    s += cache[i, j] * query[j]
+                if s >= best_sim:
+                    best = i
+                    best_sim = s
+        return best
+
+    # Compile now (or load from numba's on-disk cache) so no request pays for JIT compilation
+    _semantic_cache_scan(np.zeros((1, 1), dtype=np.float32), np.zeros(1, dtype=np.float32),
+                         np.zeros(1, dtype=np.bool_), 1.0)
+else:
+    def _semantic_cache_scan(cache, query, eligible, threshold):
+        """
+        Return the index of the eligible row of `cache` with the highest dot product with `query`,
+        if it is >= `threshold`, else -1.
+        """
+        sims = cache @ query
+        sims[~eligible] = -np.inf
+        best = int(np.argmax(sims))
+        return best if sims[best] >= threshold else -1
+
+class QueryCache:
+    """
+    A thread-safe LRU cache with TTL expiry for query results.
+    Keys are tuples whose first element is the collection name, so every entry
+    for a collection can be dropped when that collection is written to.
+    Each invalidation bumps the collection's generation; a put made with an older
+    generation is dropped, so results read before a write can't be cached after it.
+    """
+
+    def __init__(self, max_size: int = 2000, ttl_seconds: float = 600):
+        """
+        :param max_size: Maximum number of entries; the least recently used entry is evicted beyond this.
+        :param ttl_seconds: Seconds after which an entry expires.
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.RLock()
+
+    def generation(self, collection_name: str):
+        """
+        Return the current generation of `collection_name`; capture it before computing a value to put.
+        """
+        with self._lock:
+            return self._generations.get(collection_name, 0)
+
+    def get(self, key: tuple):
+        """
+        Return the cached value for `key`, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, inserted_at = entry
+            if time.monotonic() - inserted_at >= self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value, generation: int = None):
+        """
+        Cache `value` under `key`, evicting the least recently used entries if full.
+
+        :param generation: Generation captured before `value` was computed; the put is
+            skipped if the collection has been invalidated since.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generations.get(key[0], 0):
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection_name: str):
+        """
+        Drop every entry belonging to `collection_name`.
+        """
+        with self._lock:
+            self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+            stale_keys = [key for key in self._entries if key[0] == collection_name]
+            for key in stale_keys:
+                del self._entries[key]
+
+class SemanticCache:
+    """
+    A thread-safe cache of query results keyed by query embedding.
+    A lookup hits when a cached query from the same collection has cosine similarity
+    >= `threshold` with the new query, so paraphrased or near-duplicate queries reuse
+    results without searching the index. The returned scores are those computed for
+    the cached query. Generations and TTL expiry work as in QueryCache.
+    """
+
+    def __init__(self, max_size: int = 2000, threshold: float = 0.97, ttl_seconds: float = 600):
+        """
+        :param max_size: Maximum number of cached queries; the least recently used is evicted beyond this.
+            0 disables the cache.
+        :param threshold: Minimum cosine similarity for a cached query to count as a hit.
+        :param ttl_seconds: Seconds after which an entry expires.
+        """
+        if max_size < 0:
+            raise ValueError("max_size must be >= 0.")
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        # Row i of _embeddings is the normalized query embedding of slot i; the matrix is
+        # allocated on the first put, once the embedding dimension is known
+        self._embeddings = None
+        self._collections = np.full(max_size, None, dtype=object)
+        self._top_ns = np.zeros(max_size, dtype=np.int64)
+        self._last_used = np.zeros(max_size, dtype=np.int64)
+        self._inserted_at = np.zeros(max_size, dtype=np.float64)
+        self._results = [None] * max_size
+        self._clock = 0
+        self._generations = {}
+
+    def generation(self, collection_name: str):
+        """
+        Return the current generation of `collection_name`; capture it before computing results to put.
+        """
+        with self._lock:
+            return self._generations.get(collection_name, 0)
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def get(self, collection_name: str, query_embedding, top_n: int):
+        """
+        Return cached results for the most similar cached query, or None if none is similar enough.
+        Only unexpired entries from `collection_name` that hold at least `top_n` results are considered.
+        """
+        with self._lock:
+            if self._embeddings is None:
+                return None
+            eligible = (
+                (self._collections == collection_name)
+                & (self._top_ns >= top_n)
+                & (time.monotonic() - self._inserted_at < self.ttl_seconds)
+            )
+            best = int(_semantic_cache_scan(self._embeddings, self._normalize(query_embedding),
+                                            eligible, self.threshold))
+            if best < 0:
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            return list(self._results[best][:top_n])
+
+    def put(self, collection_name: str, query_embedding, top_n: int, results, generation: int = None):
+        """
+        Cache `results` for the query embedding, evicting the least recently used entry if full.
+
+        :param generation: Generation captured before `results` were computed; the put is
+            skipped if the collection has been invalidated since.
+        """
+        if self.max_size == 0:
+            return
+        vector = self._normalize(query_embedding)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(collection_name, 0):
+                return
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+            # Free slots have a last_used of 0, so they are picked before any live entry
+            slot = int(np.argmin(self._last_used))
+            self._clock += 1
+            self._embeddings[slot] = vector
+            self._collections[slot] = collection_name
+            self._top_ns[slot] = top_n
+            self._last_used[slot] = self._clock
+            self._inserted_at[slot] = time.monotonic()
+            self._results[slot] = tuple(results)
+
+    def invalidate(self, collection_name: str):
+        """
+        Drop every entry belonging to `collection_name`.
+        """
+        with self._lock:
+            self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+            for slot in np.flatnonzero(self._collections == collection_name):
+                self._collections[slot] = None
+                self._top_ns[slot] = 0
+                self._last_used[slot] = 0
+                self._results[slot] = None
+
 class VectorDB:
     """
     A Python class to perform CRUD operations on a text-based vector database.
     Uses Chroma for storage and SentenceTransformer for embedding.
     """
 
-    def __init__(self, persist_directory: str = "./chroma_db", embedding_model: str = "all-MiniLM-L6-v2"):
+    def __init__(self, persist_directory: str = "./chroma_db", embedding_model: str = "all-MiniLM-L6-v2",
+                 backend: str = None, onnx_file_name: str = ONNX_QUANTIZED_FILE, cache_config: dict = None,
+                 semantic_cache_config: dict = None, chroma_host: str = None, chroma_port: int = 8000,
+                 intra_op_threads: int = None):
         """
         Initialize the vector database client and the embedding model.
         The model all-MiniLM-L6-v2 was used because its a popular and lightweight SentenceTransformer that is
@@ -19,19 +254,137 @@ class VectorDB:
         
         :param persist_directory: Path to directory where Chroma will store data.
         :param embedding_model: Model name for SentenceTransformer embeddings.
+        :param backend: SentenceTransformer backend ("torch" or "onnx"). Defaults to "onnx" on CPU and "torch" on GPU.
+        :param onnx_file_name: ONNX file to load from the model repo when using the "onnx" backend.
+            None loads the unquantized onnx/model.onnx (exported on the fly if the repo doesn't ship one).
+        :param cache_config: QueryCache settings ("max_size", "ttl_seconds"). Defaults to DEFAULT_CACHE_CONFIG,
+            or to no caching when `chroma_host` is set.
+        :param semantic_cache_config: SemanticCache settings ("max_size", "threshold", "ttl_seconds").
+            Defaults to DEFAULT_SEMANTIC_CACHE_CONFIG with the TTL of `cache_config`, or to no caching when
+            `chroma_host` is set; "max_size": 0 disables it.
+        :param chroma_host: Host of a Chroma server to connect to instead of local storage. Required when
+            several processes (e.g. gunicorn workers) share one database; persist_directory is ignored when set.
+            Result caches are off by default in this mode, since a write through another process can't
+            invalidate this process's caches; pass cache configs explicitly to accept results up to TTL old.
+        :param chroma_port: Port of the Chroma server.
+        :param intra_op_threads: ONNX Runtime threads per inference. Defaults to the CPU count; lower it when
+            running several processes on one host.
         """
-        # Configure Chroma to persist data locally
-        self.client = chromadb.Client(
-            Settings(chroma_db_impl="duckdb+parquet", persist_directory=persist_directory)
-        )
-        # Load the embedding model
-        self.model = SentenceTransformer(embedding_model)
+        if chroma_host:
+            self.client = chromadb.HttpClient(host=chroma_host, port=chroma_port)
+        else:
+            # Configure Chroma to persist data locally (SQLite + HNSW, written through on every call)
+            self.client = chromadb.PersistentClient(path=persist_directory)
+        # The embedding model is loaded on first use (see `model`), so collection-only
+        # callers never pay for reading the weights
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._model_name = embedding_model
+        self._backend = backend
+        self._onnx_file_name = onnx_file_name
+        self._intra_op_threads = intra_op_threads
+        # Collection handles by name, reused across calls instead of looked up on every request
+        self._collections = {}
+        if chroma_host:
+            # Other processes write to the same server without invalidating this process's caches
+            cache_config = cache_config or {"max_size": 0}
+            semantic_cache_config = semantic_cache_config or {"max_size": 0}
+        # Cache of retrieve_similar_documents results, invalidated on writes to the collection
+        self._cache = QueryCache(**(cache_config or DEFAULT_CACHE_CONFIG))
+        # Catches near-duplicate queries the exact-text cache misses, at the cost of one embedding
+        semantic_cache_config = {"ttl_seconds": self._cache.ttl_seconds,
+                                 **(semantic_cache_config or DEFAULT_SEMANTIC_CACHE_CONFIG)}
+        self._semantic_cache = SemanticCache(**semantic_cache_config)
+
+    @property
+    def model(self):
+        """
+        The SentenceTransformer, loaded on the fastest available device the first time it is accessed.
+        """
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    device = self._detect_device()
+                    backend = self._backend
+                    if backend is None:
+                        backend = "onnx" if device == "cpu" else "torch"
+                    self._model = self._load_model(self._model_name, device, backend,
+                                                   self._onnx_file_name, self._intra_op_threads)
+        return self._model
+
+    @staticmethod
+    def _load_model(embedding_model: str, device: str, backend: str, onnx_file_name: str = None,
+                    intra_op_threads: int = None):
+        """
+        Construct the SentenceTransformer. The "onnx" backend runs through ONNX Runtime
+        with full graph optimizations and `intra_op_threads` threads (default: one per CPU core); the "torch"
+        backend uses FP16 weights on GPUs (CPUs without native half-precision support
+        would get slower, so they stay in FP32).
+        If the ONNX model can't be loaded, this falls back to the "torch" backend. For example,
+        with HF_HUB_OFFLINE=1 sentence-transformers still queries the hub to decide whether to
+        export, even for a cached model.
+        """
+        if backend == "onnx":
+            try:
+                import onnxruntime
+                session_options = onnxruntime.SessionOptions()
+                session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                session_options.intra_op_num_threads = intra_op_threads or os.cpu_count()
+                model_kwargs = {"session_options": session_options, "provider": "CPUExecutionProvider"}
+                if onnx_file_name is not None:
+                    model_kwargs["file_name"] = onnx_file_name
+                return SentenceTransformer(embedding_model, device=device, backend="onnx", model_kwargs=model_kwargs)
+            except Exception:
+                logger.warning("Could not load '%s' with the ONNX backend; falling back to torch.",
+                               embedding_model, exc_info=True)
+                backend = "torch"
+        model = SentenceTransformer(embedding_model, device=device, backend=backend)
+        if device in ("cuda", "mps"):
+            model = model.half()
+        return model
+
+    @staticmethod
+    def _detect_device():
+        """
+        Pick the device to run the embedding model on: CUDA, then Apple MPS, then CPU.
+        """
+        try:
+            import torch
+        except ImportError:
+            return "cpu"
+        if torch.cuda.is_available():
+            return "cuda"
+        if torch.backends.mps.is_available():
+            return "mps"
+        return "cpu"
 
     def _embed_text(self, text: str):
         """
         Convert text into a vector embedding using the SentenceTransformer model.
         """
-        return self.model.encode([text])[0].tolist()
+        return self._embed_texts([text])[0]
+
+    def _embed_texts(self, texts: list, batch_size: int = 32):
+        """
+        Convert a batch of texts into L2-normalized vector embeddings with a single model.encode call.
+
+        :param texts: List of texts to embed.
+        :param batch_size: Number of texts the model processes per forward pass.
+        :return: List of embeddings (lists of floats), in the same order as `texts`.
+        """
+        # Each forward pass pads to its longest text, so encode in length order to batch
+        # texts of similar size together, then undo the permutation
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        sorted_embeddings = self.model.encode(
+            [texts[i] for i in order],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        embeddings = np.empty_like(sorted_embeddings)
+        embeddings[order] = sorted_embeddings
+        return embeddings.tolist()
 
     def create_collection(self, name: str):
         """
@@ -39,37 +392,87 @@ class VectorDB:
         
         :param name: Name of the collection to create.
         """
-        return self.client.create_collection(name, get_or_create = True)
+        collection = self.client.create_collection(name, metadata=HNSW_METADATA, get_or_create = True)
+        self._collections[name] = collection
+        return collection
+
+    def _get_collection(self, name: str):
+        """
+        Return the handle for collection `name`, creating the collection if needed.
+        Handles are cached for the life of this VectorDB.
+        """
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self.client.get_or_create_collection(name, metadata=HNSW_METADATA)
+            self._collections[name] = collection
+        return collection
+
+    def _run_on_collection(self, name: str, operation):
+        """
+        Call `operation(collection)` with the cached handle for `name`. If another process
+        deleted or recreated the collection, the handle points at a collection id that no
+        longer exists; drop it, fetch a fresh handle and retry once.
+        """
+        try:
+            return operation(self._get_collection(name))
+        except InvalidCollectionException:
+            self._collections.pop(name, None)
+            self._invalidate_caches(name)
+            return operation(self._get_collection(name))
 
-    def insert_document(self, collection_name: str, doc_id: str, text: str):
+    def insert_document(self, collection_name: str, doc_id: str, text: str, embedding: list = None):
         """
         Insert a new text document into the collection.
         
         :param collection_name: Name of the collection to insert the document into.
         :param doc_id: An identifier for the document.
         :param text: The text content to be vectorized and stored.
+        :param embedding: Precomputed embedding for `text` (e.g. from EmbeddingBatcher); computed if omitted.
         """
-        collection = self.client.get_or_create_collection(collection_name)
-        embedding = self._embed_text(text)
-        collection.add(
-            ids=[doc_id],
-            embeddings=[embedding],
-            metadatas=[{"text": text}]
-        )
+        embeddings = [embedding] if embedding is not None else None
+        self.insert_documents(collection_name, [doc_id], [text], embeddings=embeddings)
+
+    def insert_documents(self, collection_name: str, doc_ids: list, texts: list, embeddings: list = None):
+        """
+        Insert many text documents into the collection with one embedding pass and one write.
+        
+        :param collection_name: Name of the collection to insert the documents into.
+        :param doc_ids: Identifiers for the documents.
+        :param texts: The text contents to be vectorized and stored, in the same order as `doc_ids`.
+        :param embeddings: Precomputed embeddings for `texts`; computed if omitted.
+        """
+        if len(doc_ids) != len(texts):
+            raise ValueError("doc_ids and texts must have the same length.")
+        if not texts:
+            return
+        if embeddings is None:
+            embeddings = self._embed_texts(list(texts), batch_size=64)
+        self._run_on_collection(collection_name, lambda collection: collection.add(
+            ids=list(doc_ids),
+            embeddings=embeddings,
+            documents=list(texts)
+        ))
+        self._invalidate_caches(collection_name)
 
-    def update_document(self, collection_name: str, doc_id: str, new_text: str):
+    def update_document(self, collection_name: str, doc_id: str, new_text: str, embedding: list = None):
         """
-        Update/Replace an existing text document in the database.
+        Update/Replace a text document in the database, inserting it if `doc_id` doesn't exist yet.
         
         :param collection_name: Name of the collection containing the document.
         :param doc_id: The identifier of the document to update.
         :param new_text: The new text content to replace the old content.
+        :param embedding: Precomputed embedding for `new_text`; computed if omitted.
         """
-        collection = self.client.get_collection(collection_name)
-        # Delete old entry first
-        collection.delete(ids=[doc_id])
-        # Insert updated entry
-        self.insert_document(collection_name, doc_id, new_text)
+        if embedding is None:
+            embedding = self._embed_text(new_text)
+        # Upsert in place rather than delete + re-insert, so the index is only modified once;
+        # like the old delete + insert, a missing doc_id is inserted rather than silently ignored
+        self._run_on_collection(collection_name, lambda collection: collection.upsert(
+            ids=[doc_id],
+            embeddings=[embedding],
+            documents=[new_text]
+        ))
+        self._invalidate_caches(collection_name)
 
     def delete_document(self, collection_name: str, doc_id: str):
         """
@@ -78,60 +481,183 @@ class VectorDB:
         :param collection_name: Name of the collection containing the document.
         :param doc_id: The identifier of the document to delete.
         """
-        collection = self.client.get_collection(collection_name)
-        collection.delete(ids=[doc_id])
+        self._run_on_collection(collection_name, lambda collection: collection.delete(ids=[doc_id]))
+        self._invalidate_caches(collection_name)
+
+    def _invalidate_caches(self, collection_name: str):
+        """
+        Drop cached query results for a collection after it has been written to.
+        """
+        self._cache.invalidate(collection_name)
+        self._semantic_cache.invalidate(collection_name)
 
-    def retrieve_similar_documents(self, collection_name: str, query_text: str, top_n: int = 3):
+    def cached_similar_documents(self, collection_name: str, query_text: str, top_n: int = 3):
+        """
+        Return the cached result of retrieve_similar_documents for these arguments, or None if not cached.
+        Lets callers skip computing the query embedding on a cache hit.
+        """
+        cached = self._cache.get((collection_name, query_text, top_n))
+        return list(cached) if cached is not None else None
+
+    def retrieve_similar_documents(self, collection_name: str, query_text: str, top_n: int = 3,
+                                   query_embedding: list = None):
         """
         Retrieve the top N most relevant documents in the collection, given the query text.
         
         :param collection_name: Name of the collection to search in.
         :param query_text: The query text to match against stored documents.
         :param top_n: Number of documents to retrieve.
+        :param query_embedding: Precomputed embedding for `query_text`; computed if omitted.
         :return: List of (doc_id, text, score) tuples for the most relevant documents.
         """
-        collection = self.client.get_collection(collection_name)
-        query_embedding = self._embed_text(query_text)
-        results = collection.query(
+        # Captured before reading anything, so results that a concurrent write makes stale aren't cached
+        exact_generation = self._cache.generation(collection_name)
+        semantic_generation = self._semantic_cache.generation(collection_name)
+        cached = self.cached_similar_documents(collection_name, query_text, top_n)
+        if cached is not None:
+            return cached
+        if query_embedding is None:
+            query_embedding = self._embed_text(query_text)
+        # A hit isn't copied into the exact cache: that would restart the TTL of results
+        # that are already up to ttl_seconds old
+        output = self._semantic_cache.get(collection_name, query_embedding, top_n)
+        if output is not None:
+            return output
+        # Only fetch the columns used below; ids are always returned
+        results = self._run_on_collection(collection_name, lambda collection: collection.query(
             query_embeddings=[query_embedding],
-            n_results=top_n
-        )
+            n_results=top_n,
+            include=["documents", "distances"]
+        ))
         # The results object typically looks like:
         # {
         #    'ids': [['doc1', 'doc2']],
-        #    'metadatas': [[{'text': 'Sample text1'}, {'text': 'Sample text2'}]],
-        #    'embeddings': [[[...] ... ]],
+        #    'documents': [['Sample text1', 'Sample text2']],
         #    'distances': [[distance1, distance2]]
         # }
-        output = []
-        for i, doc_id in enumerate(results['ids'][0]):
-            text_content = results['metadatas'][0][i]['text']
-            distance = results['distances'][0][i]
-            similarity_score = 1.0 - distance  # simple conversion if needed
-            output.append((doc_id, text_content, similarity_score))
+        texts = results['documents'][0]
+        # "ip" distance is 1 - dot, i.e. 1 - cosine for normalized vectors
+        similarity_scores = 1.0 - np.asarray(results['distances'][0], dtype=np.float64)
+        output = list(zip(results['ids'][0], texts, similarity_scores.tolist()))
+        self._cache.put((collection_name, query_text, top_n), tuple(output), generation=exact_generation)
+        self._semantic_cache.put(collection_name, query_embedding, top_n, output, generation=semantic_generation)
         return output
     
     def delete_collection(self, name: str):
         """
         Delete an entire collection from the database if it exists.
         """
-        # Fetch all existing collections
-        all_collections = self.client.list_collections()
-        # Convert them to a simple list of collection names
-        existing_names = [c.name for c in all_collections]
-        
-        # Check if `name` is in the list of existing collection names
-        if name in existing_names:
+        # Drop local state whether or not the collection still exists in Chroma
+        self._collections.pop(name, None)
+        self._invalidate_caches(name)
+        # Delete directly and treat "does not exist" as a skip, rather than
+        # listing every collection first to check. The embedded client raises ValueError;
+        # HttpClient re-raises the server's ValueError as InvalidArgumentError.
+        try:
             self.client.delete_collection(name)
-            print(f"Collection '{name}' deleted.")
-        else:
-            print(f"Collection '{name}' does not exist; skipping delete.")
+        except (ValueError, InvalidArgumentError):
+            logger.debug("Collection '%s' does not exist; skipping delete.", name)
+            return
+        logger.debug("Collection '%s' deleted.", name)
 
 
 
 
     def persist(self):
         """
-        Eusre that the collection is created and fully persisted before any other tests or methods that depend on it are ran
+        Kept for backwards compatibility. PersistentClient writes every change to disk as it is made,
+        so there is nothing left to flush.
+        """
+
+
+class EmbeddingBatcher:
+    """
+    Coalesce concurrent embedding requests into batched model.encode calls.
+
+    Callers await `embed(text)`; a background worker drains up to `max_batch_size`
+    queued texts (waiting at most `max_wait` seconds for the batch to fill), encodes
+    them in one call and resolves each caller's Future with its embedding.
+    """
+
+    def __init__(self, db: VectorDB, max_batch_size: int = 32, max_wait: float = 0.005):
+        """
+        :param db: VectorDB whose embedding model is used for encoding.
+        :param max_batch_size: Maximum number of texts encoded per model call.
+        :param max_wait: Maximum time (seconds) to wait for a batch to fill.
         """
-        self.client.persist() 
\ No newline at end of file
+        self.db = db
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = None
+        self._worker = None
+        self._executor = None
+
+    def start(self, executor=None):
+        """
+        Start the background worker. Must be called from within the running event loop.
+
+        :param executor: concurrent.futures.Executor to encode batches in; the loop's default executor if None.
+        """
+        self._executor = executor
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Cancel the background worker and wait for it to exit.
+        """
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    async def embed(self, text: str):
+        """
+        Queue `text` for the next batch and wait for its embedding.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _next_batch(self):
+        """
+        Wait for the first queued item, then collect more until the batch is full or `max_wait` elapses.
+        """
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            # Requests whose caller went away (e.g. client disconnected) don't need encoding
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            texts = [text for text, _ in batch]
+            try:
+                # Encode off the event loop so it keeps accepting requests meanwhile
+                embeddings = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self.db._embed_texts, texts, self.max_batch_size
+                )
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)